@@ -11,7 +11,7 @@
 #       OPTIONS:  ---
 #
 #  REQUIREMENTS:  - python3
-#                   - lxml
+#                   - lxml (optional; falls back to xml.etree.ElementTree)
 #          BUGS:  - No big XML dumps output format support (not yet)
 #                 - No support for PBF Format (...not yet)
 #         NOTES:  ---
@@ -26,13 +26,22 @@
 #                 2022-12-21 01:46:00Z v0.3.0 osmrdf2022.py -> osmrdf2023.py
 # ==============================================================================
 
+import collections
+import functools
+import io
+import multiprocessing
 import os
 import sys
-from typing import List, Type
-import xml.etree.ElementTree as XMLElementTree
-from lxml import etree
+from typing import Callable, List, Optional
+
+try:
+    from lxml import etree
+    _HAVE_LXML = True
+except ImportError:
+    # Pure Python interpreters such as PyPy may lack an lxml build
+    import xml.etree.ElementTree as etree
+    _HAVE_LXML = False
 
-import requests
 import requests_cache
 
 # See also: https://wiki.openstreetmap.org/wiki/Sophox#How_OSM_data_is_stored
@@ -49,6 +58,13 @@ RDF_TURTLE_PREFIXES = [
     'PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>',
 ]
 
+# RDF_TURTLE_PREFIXES followed by an empty line, joined once at import
+_PREFIX_BLOCK = '\n'.join(RDF_TURTLE_PREFIXES) + '\n\n'
+_TURTLE_HEADER_BYTES = _PREFIX_BLOCK.encode()
+
+# XML elements converted to Turtle; everything else is only read as children
+OSM_PRIMITIVES = ('node', 'way', 'relation')
+
 OSM_ELEMENT_PREFIX = {
     'node': 'osmnode:',
     'relation': 'osmrel:',
@@ -56,6 +72,9 @@ OSM_ELEMENT_PREFIX = {
     'way': 'osmway:'
 }
 
+# Subset of OSM_ELEMENT_PREFIX valid as <member type="">, used on hot loops
+OSMX_MEMBER_PREFIX = {k: OSM_ELEMENT_PREFIX[k] for k in OSM_PRIMITIVES}
+
 # Using Sophox
 OSM_ELEMENT_TYPE_LITERAL = {
     'node': 'n',
@@ -97,7 +116,10 @@ class OSMApiv06Xml:
         #     file_or_string,
         #     events=('start', 'end')
         # )
-        root = XMLElementTree.fromstring(file_or_string)
+        if isinstance(file_or_string, str):
+            # lxml refuses str input with an XML encoding declaration
+            file_or_string = file_or_string.encode()
+        root = etree.fromstring(file_or_string)
         self.xmlroot = root
         self.root_tag = root.tag
         self.root_attrib = root.attrib
@@ -105,44 +127,37 @@ class OSMApiv06Xml:
     def node(self):
 
         for child in self.xmlroot:
-            # print('>>>>> el', child.tag, child.attrib)
-            # print('>>>>> el tags', child.findall("tag"))
-            xml_tags = None
-            _eltags = child.findall("tag")
-            if _eltags:
-                xml_tags = []
-                for item in _eltags:
-                    xml_tags.append((item.attrib['k'], item.attrib['v']))
-            # print('>>>>> el nd', child.findall("nd"))
-            xml_nds = None
-            _elnds = child.findall("nd")
-            if _elnds:
-                xml_nds = []
-                for item in _elnds:
-                    xml_nds.append(int(item.attrib['ref']))
+            return self.element(child)
 
-            xml_members = None
-            _elmembers = child.findall("member")
-            if _elmembers:
-                xml_members = []
-                for item in _elmembers:
-                    # @FIXME this is incomplete
-                    _type = item.attrib['type']
-                    _ref = int(item.attrib['ref'])
-                    _role = item.attrib['role'] if 'role' in item.attrib else None
-                    xml_members.append((_type, _ref, _role))
-            # print('>>>>> el2', dict(child.attrib))
-            # # @TODO restrict here to node, way, relation, ...
-            # print('>>>>> el3', OSMElement(
-            #     child.tag, dict(child.attrib)).__dict__)
-            return OSMElement(
-                child.tag,
-                dict(child.attrib),
-                xml_tags,
-                xml_nds,
-                xml_members
-            )
-            break
+    @staticmethod
+    def element(child) -> 'OSMElement':
+        """Convert one parsed <node>, <way> or <relation> to OSMElement
+
+        Works both with the full tree from __init__ and with elements yielded
+        by etree.iterparse(), so streamed responses can skip the tree.
+        """
+        # print('>>>>> el', child.tag, child.attrib)
+        xml_tags = []
+        xml_nds = []
+        xml_members = []
+        # Single pass over the children instead of one findall() per type
+        for sub in child:
+            if sub.tag == 'tag':
+                xml_tags.append((sub.get('k'), sub.get('v')))
+            elif sub.tag == 'nd':
+                xml_nds.append(int(sub.get('ref')))
+            elif sub.tag == 'member':
+                # @FIXME this is incomplete
+                xml_members.append(
+                    (sub.get('type'), int(sub.get('ref')), sub.get('role')))
+        # # @TODO restrict here to node, way, relation, ...
+        return OSMElement(
+            child.tag,
+            dict(child.attrib),
+            xml_tags,
+            xml_nds,
+            xml_members
+        )
 
 
 class OSMElement:
@@ -150,49 +165,57 @@ class OSMElement:
 
     Note: this will not do additional checks if input data is valid
     """
+    # Dumps create tens of millions of these; no per-instance __dict__
+    __slots__ = (
+        '_basegroup', '_tag', '_el_osm_tags', '_el_osm_nds',
+        '_el_osm_members', '_xml_filter', '_tagcaster', 'id', 'changeset',
+        'timestamp', 'user', 'userid', 'version', 'visible', 'lat', 'lon')
+
     _basegroup: str
     _tag: str
-    _el_osm_tags: List[tuple]
-    _el_osm_nds: List[int]
-    _el_osm_members: List[tuple]
-    _xml_filter: Type['OSMElementFilter']
-    _tagcaster: Type['OSMElementTagValueCast']
-    id: int
-    changeset: int
-    timestamp: str  # maybe chage later
-    user: str
-    userid: str
-    version: str
+    _el_osm_tags: Optional[List[tuple]]
+    _el_osm_nds: Optional[List[int]]
+    _el_osm_members: Optional[List[tuple]]
+    _xml_filter: Optional['OSMElementFilter']
+    _tagcaster: Optional['OSMElementTagValueCast']
+    id: Optional[int]
+    changeset: Optional[int]
+    timestamp: Optional[str]  # maybe chage later
+    user: Optional[str]
+    userid: Optional[int]
+    version: Optional[str]
     visible: bool
-    lat: float
-    lon: float
+    lat: Optional[float]
+    lon: Optional[float]
 
     def __init__(
         self, tag: str, meta: dict,
-        xml_tags: List[tuple] = None,
-        xml_nds: List[int] = None,
-        xml_members: List[tuple] = None,
-        xml_filter: Type['OSMElementFilter'] = None,
-        tagcaster: Type['OSMElementTagValueCast'] = None,
+        xml_tags: Optional[List[tuple]] = None,
+        xml_nds: Optional[List[int]] = None,
+        xml_members: Optional[List[tuple]] = None,
+        xml_filter: Optional['OSMElementFilter'] = None,
+        tagcaster: Optional['OSMElementTagValueCast'] = None,
     ):
         if not isinstance(meta, dict):
             meta = dict(meta)
 
-        self.id = int(meta['id']) if 'id' in meta else None
+        _get = meta.get
 
+        _id = _get('id')
+        self.id = int(_id) if _id is not None else None
         # self.version = float(meta['version']) if 'version' in meta else None
-        self.version = meta['version'] if 'version' in meta else None
-        self.changeset = int(
-            meta['changeset']) if 'changeset' in meta else None
-
-        self.timestamp = meta['timestamp'] if 'timestamp' in meta else None
-
-        self.user = meta['user'] if 'user' in meta else None
-
+        self.version = _get('version')
+        _changeset = _get('changeset')
+        self.changeset = int(_changeset) if _changeset is not None else None
+        self.timestamp = _get('timestamp')
+        self.user = _get('user')
         # uid = userid
-        self.userid = int(meta['uid']) if 'uid' in meta else None
-        self.lat = float(meta['lat']) if 'lat' in meta else None
-        self.lon = float(meta['lon']) if 'lon' in meta else None
+        _uid = _get('uid')
+        self.userid = int(_uid) if _uid is not None else None
+        _lat = _get('lat')
+        self.lat = float(_lat) if _lat is not None else None
+        _lon = _get('lon')
+        self.lon = float(_lon) if _lon is not None else None
 
         self._tag = tag
         self._basegroup = '{0}{1}'.format(
@@ -209,88 +232,94 @@ class OSMElement:
             return False
         return True
 
-    def to_ttl(self) -> list:
-        data = []
-        data.append(self._basegroup)
+    def to_ttl(self, out: io.StringIO) -> None:
+        """Write this element as one Turtle stanza into out
 
+        Each line, including the final '.', ends with a newline. Callers
+        share one buffer and call out.getvalue() once.
+        """
+        _write = out.write
+        _write(f'{self._basegroup}\n')
         if self.changeset:
-            data.append(f'    osmm:changeset {self.changeset} ;')
+            _write(f'    osmm:changeset {self.changeset} ;\n')
         if self.lat and self.lon:
-            data.append(
-                f'    osmm:loc "Point({self.lat} {self.lon})"^^geo:wktLiteral ;')
+            _write(
+                f'    osmm:loc "Point({self.lat} {self.lon})"^^geo:wktLiteral ;\n')
         if self.timestamp:
-            data.append(
-                f'    osmm:timestamp "{self.timestamp}"^^xsd:dateTime ;')
-        if self._tag in OSM_ELEMENT_TYPE_LITERAL.keys():
-            data.append(
-                f'    osmm:type "{OSM_ELEMENT_TYPE_LITERAL[self._tag]}" ;')
+            _write(f'    osmm:timestamp "{self.timestamp}"^^xsd:dateTime ;\n')
+        if self._tag in OSM_ELEMENT_TYPE_LITERAL:
+            _write(f'    osmm:type "{OSM_ELEMENT_TYPE_LITERAL[self._tag]}" ;\n')
         if self.user:
-            data.append(
-                f'    osmm:user "{self.user}" ;')
+            _write(f'    osmm:user "{osmrdf_ttl_string_escape(self.user)}" ;\n')
         if self.userid:
-            data.append(
-                f'    osmm:userid {self.userid} ;')
+            _write(f'    osmm:userid {self.userid} ;\n')
         if self.version:
-            data.append(
-                f'    osmm:version {self.version} ;')
-
-        # data.append('    # TODO implement the tags')
+            _write(f'    osmm:version {self.version} ;\n')
 
         if self._el_osm_tags:
+            _tagcaster = self._tagcaster
             for key, value in self._el_osm_tags:
                 _escp_key = osmrdf_tagkey_encode(key)
 
-                data.append(
-                    f'    osmt:{_escp_key} "{value}" ;')
+                _write(
+                    f'    osmt:{_escp_key} "{osmrdf_ttl_string_escape(value)}" ;\n')
 
-                if self._tagcaster and self._tagcaster.can_cast(_escp_key):
-                    data.append(self._tagcaster.to_ttl(_escp_key, value))
+                if _tagcaster and _tagcaster.can_cast(_escp_key):
+                    _write(_tagcaster.to_ttl(_escp_key, value) + '\n')
 
         if self._el_osm_nds:
-            _parts = []
-            for ref in self._el_osm_nds:
-                _parts.append(f'osmnode:{ref}')
-            data.append(
-                f'    osmx:hasnodes ({" ".join(_parts)}) ;')
+            _nodes = ' '.join([f'osmnode:{ref}' for ref in self._el_osm_nds])
+            _write(f'    osmx:hasnodes ({_nodes}) ;\n')
 
         if self._el_osm_members:
-            _parts = []
-            for _type, _ref, _role in self._el_osm_members:
-                _prefix = OSM_ELEMENT_PREFIX[_type]
-
-                _parts.append(f'[osmx:hasrole{_role} {_prefix}{_ref}]')
-            data.append(
-                f'    osmx:hasmembers ({" ".join(_parts)}) ;')
+            _pfx = OSMX_MEMBER_PREFIX
+            _members = ' '.join([
+                f'[osmx:hasrole{_role} {_pfx[_type]}{_ref}]'
+                for _type, _ref, _role in self._el_osm_members])
+            _write(f'    osmx:hasmembers ({_members}) ;\n')
 
-        data.append('.')
-        return data
+        _write('.\n')
 
 
 class OSMElementFilter:
     """Helper for OSMElement limit what to output
     """
 
-    xml_tags: List = None
-    xml_tags_not: List = None
+    xml_tags: Optional[frozenset] = None
+    xml_tags_not: Optional[frozenset] = None
+    _checker: Callable[[str], bool]
 
     def __init__(self) -> None:
-        pass
+        self._checker = self._make_checker()
 
     def set_filter_xml_tags(self, tags: list):
-        self.xml_tags = tags
+        self.xml_tags = frozenset(tags) if tags else None
+        self._checker = self._make_checker()
         return self
 
     def set_filter_xml_tags_not(self, tags: list):
-        self.xml_tags_not = tags
+        self.xml_tags_not = frozenset(tags) if tags else None
+        self._checker = self._make_checker()
         return self
 
     def can_tag(self, tag: str) -> bool:
-        if not self.xml_tags and not self.xml_tags_not:
-            return True
-        if (not self.xml_tags or tag in self.xml_tags) and \
-                (not self.xml_tags_not or tag not in self.xml_tags_not):
-            return True
-        return False
+        return self._checker(tag)
+
+    def _make_checker(self) -> Callable[[str], bool]:
+        """Specialize can_tag() for the filters set, once per change
+
+        Called once per element on dumps, so each case is reduced to at
+        most two frozenset lookups, without re-testing which filter is set.
+        """
+        xml_tags = self.xml_tags
+        xml_tags_not = self.xml_tags_not
+        if not xml_tags and not xml_tags_not:
+            return lambda tag: True
+        if not xml_tags_not:
+            return xml_tags.__contains__
+        if not xml_tags:
+            return lambda tag: tag not in xml_tags_not
+        return lambda tag: tag in xml_tags and tag not in xml_tags_not
 
 
 class OSMElementTagger:
@@ -302,6 +331,9 @@ class OSMElementTagger:
 +	<way>|<relation>	*	shacl:lessThanOrEquals:maxspeed=120
     """
     rules: list = None
+    # (element or None for any, tag key) -> tag value; built by parse_rules
+    _add: dict = None
+    _del: dict = None
 
     def __init__(self, rules=None) -> None:
         # if rules:
@@ -314,6 +346,8 @@ class OSMElementTagger:
         # print('todooo')
         try:
             rules = []
+            _add = {}
+            _del = {}
             for index, line in enumerate(parts):
                 line = line.split("\t")
                 # print(line)
@@ -335,8 +369,13 @@ class OSMElementTagger:
                     'xack': _xml_c_attr_key,
                     'xacv': _xml_c_attr_value,
                 })
+                _ops = _add if _op == '+' else _del
+                for _element in (_xml_tag or [None]):
+                    _ops[(_element, _xml_c_attr_key)] = _xml_c_attr_value
             if rules:
                 self.rules = rules
+                self._add = _add
+                self._del = _del
         except Exception as err:
             print(f"ERROR OSMElementTagger: {err}")
             print('--- start of file ---')
@@ -348,47 +387,33 @@ class OSMElementTagger:
         # print(rules_tsv, self.rules)
         # sys.exit()
 
-    def retag(self, element: str, de_facto_tags: List[tuple] = None):
-        new_tags = de_facto_tags
-        if self.rules:
-            new_tags_temp = []
-            left_rules = list(range(0, len(self.rules)))
-            # print(left_rules, len(self.rules))
-            for rule in self.rules:
-                if rule['xt'] is not None and element not in rule['xt']:
-                    left_rules.remove(rule['i'])
-                    continue
-                # TODO implement attribute check
-                # new_tags_temp = new_tags
-                new_tags_temp = []
-                for tag_key, tag_value in new_tags:
-                    if rule['op'] == '-':
-                        if tag_key in rule['xack']:
-                            left_rules.remove(rule['i'])
-                            continue
-                    if rule['op'] == '+':
-                        if tag_key in rule['xack']:
-                            tag_value = rule['xacv']
-                            left_rules.remove(rule['i'])
-                            break
-                        else:
-                            pass
-                            # continue
-                    new_tags_temp.append((tag_key, tag_value))
-            new_tags = new_tags_temp
-            if len(left_rules) > 0:
-                for rule_index in left_rules:
-                    if self.rules[rule_index]['op'] == '+':
-                        # print('TODO add ', self.rules[rule_index])
-                        new_tags.append(
-                            (self.rules[rule_index]['xack'], self.rules[rule_index]['xacv']))
-                        # pass
-                    # raise SyntaxError(self.rules[rule_index]['op'])
-                pass
-        # if element == 'relation':
-        #     print('todo', element, de_facto_tags,
-        #           self.rules, new_tags_temp, left_rules)
-            # sys.exit()
+    def retag(
+            self, element: str,
+            de_facto_tags: Optional[List[tuple]] = None) -> List[tuple]:
+        if not self.rules:
+            return de_facto_tags
+
+        # TODO implement attribute check
+        _add = self._add
+        _del = self._del
+        new_tags = []
+        seen = set()
+        for tag_key, tag_value in (de_facto_tags or []):
+            if (element, tag_key) in _del or (None, tag_key) in _del:
+                continue
+            _value = _add.get((element, tag_key))
+            if _value is None:
+                _value = _add.get((None, tag_key))
+            new_tags.append(
+                (tag_key, _value if _value is not None else tag_value))
+            seen.add(tag_key)
+
+        # '+' rules without a de facto tag to override are added as new tags
+        for (_element, tag_key), tag_value in _add.items():
+            if (_element is None or _element == element) and \
+                    tag_key not in seen:
+                new_tags.append((tag_key, tag_value))
+                seen.add(tag_key)
         return new_tags
 
 
@@ -417,72 +442,78 @@ class OSMElementTagValueCast:
         return f'    osmx:{tagkey} wikidata:{tagvalue} ;'
 
 
-def osmrdf_node_xml2ttl(data_xml: str):
-
-    osmx = OSMApiv06Xml(data_xml)
-    osmnode = osmx.node()
+def osmrdf_element_xml2ttl(context) -> Optional[str]:
+    """osmrdf_element_xml2ttl Turtle of one OSM API v0.6 node/way/relation
 
-    output = []
-    output.extend(RDF_TURTLE_PREFIXES)
-    output.append('')
-
-    output.extend(osmnode.to_ttl())
-
-    output.append('')
-    # DEBUG: next 2 lines will print the XML node, commented
-    # comment = "# " + "\n# ".join(data_xml.split("\n"))
-    # output.append(comment)
-
-    return "\n".join(output)
+    Args:
+        context: osmrdf_xml_iterparse() over an OSM API v0.6 response.
+                 Only the first element is consumed.
 
+    Returns:
+        Optional[str]: prefixes plus the element stanza, or None if the
+                       response has no node, way or relation
+    """
+    _first = next(context, None)
+    if _first is None:
+        return None
 
-def osmrdf_relation_xml2ttl(data_xml: str):
+    output = io.StringIO()
+    output.write(_PREFIX_BLOCK)
+    OSMApiv06Xml.element(_first[1]).to_ttl(output)
+    return output.getvalue()
 
-    osmx = OSMApiv06Xml(data_xml)
-    osmnode = osmx.node()
 
-    output = []
-    output.extend(RDF_TURTLE_PREFIXES)
-    output.append('')
+def osmrdf_node_xml2ttl(data_xml: str) -> Optional[str]:
+    """osmrdf_node_xml2ttl Turtle of an OSM API v0.6 XML string
 
-    output.extend(osmnode.to_ttl())
+    The old per-type API took the response as a str; node, way and
+    relation all convert the same way.
+    """
+    if isinstance(data_xml, str):
+        data_xml = data_xml.encode()
+    return osmrdf_element_xml2ttl(osmrdf_xml_iterparse(io.BytesIO(data_xml)))
 
-    output.append('')
-    # DEBUG: next 2 lines will print the XML node, commented
-    comment = "# " + "\n# ".join(data_xml.split("\n"))
-    output.append(comment)
 
-    return "\n".join(output)
+osmrdf_relation_xml2ttl = osmrdf_node_xml2ttl
+osmrdf_way_xml2ttl = osmrdf_node_xml2ttl
 
 
+@functools.lru_cache(maxsize=None)
 def osmrdf_tagkey_encode(raw_tag: str) -> str:
+    # Pure function over a small set of distinct keys, so it is memoized
     # @TODO improve-me
     # return raw_tag.replace(':', '%3A').replace(' ', '%20')
     return raw_tag.replace(' ', '%20')
 
 
-def osmrdf_way_xml2ttl(data_xml: str):
-
-    osmx = OSMApiv06Xml(data_xml)
-    osmnode = osmx.node()
-
-    # print(osmnode)
-    # print(type(osmnode))
-    # print(osmnode.to_ttl())
-    # print(type(osmnode.to_ttl()))
+def osmrdf_ttl_string_escape(value: str) -> str:
+    """Escape a str to go between double quotes in Turtle
 
-    output = []
-    output.extend(RDF_TURTLE_PREFIXES)
-    output.append('')
+    @see https://www.w3.org/TR/turtle/#sec-escapes
+    """
+    # Most OSM values need no escaping; these checks are cheaper than
+    # the replace() chain (str.translate() to multi-char strings is slower)
+    if '"' in value or '\\' in value or '\n' in value or '\r' in value \
+            or '\t' in value:
+        return value.replace('\\', '\\\\').replace('"', '\\"') \
+            .replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
+    return value
 
-    output.extend(osmnode.to_ttl())
 
-    output.append('')
-    # DEBUG: next 2 lines will print the XML node, commented
-    # comment = "# " + "\n# ".join(data_xml.split("\n"))
-    # output.append(comment)
+def osmrdf_xml_iterparse(source):
+    """Iterate ('end', element) only for OSM_PRIMITIVES of an OSM XML
 
-    return "\n".join(output)
+    lxml filters natively; the xml.etree fallback (e.g. on PyPy) filters
+    in Python, since its iterparse() has no tag argument.
+    """
+    if _HAVE_LXML:
+        return etree.iterparse(
+            source, events=('end',), tag=OSM_PRIMITIVES,
+            huge_tree=False, recover=False)
+    return (
+        (event, elem)
+        for event, elem in etree.iterparse(source, events=('end',))
+        if elem.tag in OSM_PRIMITIVES)
 
 
 def osmrdf_xmldump2_ttl(xml_file_path, xml_filter: OSMElementFilter = None):
@@ -500,10 +531,10 @@ def osmrdf_xmldump2_ttl(xml_file_path, xml_filter: OSMElementFilter = None):
 
     all_records = []
 
-    print('\n'.join(RDF_TURTLE_PREFIXES))
-    print('')
+    print(_PREFIX_BLOCK, end='')
 
     count = 0
+    buffer = io.StringIO()
     xml_tags = []
     xml_nds = []
     xml_members = []
@@ -564,7 +595,10 @@ def osmrdf_xmldump2_ttl(xml_file_path, xml_filter: OSMElementFilter = None):
             xml_nds = []
             xml_members = []
             if el.can_output():
-                print('\n'.join(el.to_ttl()) + '\n')
+                el.to_ttl(buffer)
+                print(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate()
                 count += 1
 
         # if count > 10:
@@ -573,81 +607,161 @@ def osmrdf_xmldump2_ttl(xml_file_path, xml_filter: OSMElementFilter = None):
 
 def osmrdf_xmldump2_ttl_v2(
         xml_file_path,
-        xml_filter: OSMElementFilter = None, retagger: str = None):
+        xml_filter: OSMElementFilter = None, retagger: str = None,
+        workers: int = None):
+    """osmrdf_xmldump2_ttl_v2 convert an OSM XML dump to Turtle on stdout
+
+    Args:
+        xml_file_path: path (or file object) of the uncompressed OSM XML
+        xml_filter (OSMElementFilter, optional): which elements to output
+        retagger (str, optional): OSMElementTagger rules, as TSV
+        workers (int, optional): with more than 1, elements are converted
+            by a pool of that many processes. Output order is unchanged.
+    """
     # context = etree.iterparse(xml_file_path, events=('end',), tag='node')
     # context = etree.iterparse(xml_file_path, events=('end',), tag=('way'))
 
-    print('\n'.join(RDF_TURTLE_PREFIXES))
-    print('')
-
     # _tags = ('node', 'way', 'relation')
     _tags = ('way', 'relation')
     _rules = """+	<way>	*	is_in=BRA
 -	<node>|<way>|<relation>	*	created_by=*
 +	<way>|<relation>	*	shacl:lessThanOrEquals:maxspeed=120"""
     # retagger = OSMElementTagger(_rules)
-    retagger = OSMElementTagger(retagger)
-    tagcaster = OSMElementTagValueCast(None)
 
-    # context = etree.iterparse(xml_file_path, events=('end',), tag=_tags)
-    context = etree.iterparse(xml_file_path, events=('end',))
+    records = _osmrdf_xmldump_records(xml_file_path, xml_filter)
+
+    # One large buffer over the binary stdout: far fewer syscalls than one
+    # print() per element. detach() flushes without closing sys.stdout.
+    sys.stdout.flush()
+    stdout = io.BufferedWriter(sys.stdout.buffer, buffer_size=1 << 20)
+    write = stdout.write
+    write(_TURTLE_HEADER_BYTES)
+
+    try:
+        if workers and workers > 1:
+            _osmrdf_xmldump_records2ttl_pool(records, retagger, workers, write)
+            return
+
+        tagger = OSMElementTagger(retagger)
+        tagcaster = OSMElementTagValueCast(None)
+        buffer = io.StringIO()
+        for record in records:
+            _osmrdf_record2ttl(record, tagger, tagcaster, buffer)
+            write(buffer.getvalue().encode())
+            buffer.seek(0)
+            buffer.truncate()
+    finally:
+        stdout.detach()
+
+
+def _osmrdf_xmldump_records(xml_file_path, xml_filter: OSMElementFilter):
+    """Yield each node/way/relation of an OSM XML dump as plain tuples
+
+    (tag, attrib, tags, nds, members); nothing from lxml is kept, so
+    records can be pickled to worker processes. Implicit <tagi /> tags are
+    merged with the <tag /> ones.
+
+    The three lists are reused (cleared) for the next element; copy them
+    if a record must outlive the iteration step.
+    """
+    # Only node/way/relation fire events; their <tag>, <nd>, <member>
+    # children are consumed below from the already parsed element
+    context = osmrdf_xml_iterparse(xml_file_path)
 
-    count = 0
     xml_tags = []
     xml_nds = []
     xml_members = []
     for _event, elem in context:
-        # if elem.tag in ['osm', 'bounds', 'nd', 'member', 'tag']:
-        if elem.tag in ['osm', 'bounds', 'nd', 'member', 'tag', 'tagi']:
-            continue
+        if xml_filter is None or xml_filter.can_tag(elem.tag):
+            xml_tags.clear()
+            xml_nds.clear()
+            xml_members.clear()
+            for sub in elem:
+                _subtag = sub.tag
+                if _subtag == 'tag' or _subtag == 'tagi':
+                    # "Implicit" tag "<tagi />" is retagged like any other
+                    xml_tags.append((sub.get('k'), sub.get('v')))
+                elif _subtag == 'nd':
+                    xml_nds.append(int(sub.get('ref')))
+                elif _subtag == 'member':
+                    # @FIXME this is incomplete
+                    xml_members.append(
+                        (sub.get('type'), int(sub.get('ref')), sub.get('role')))
 
-        _eltags = elem.findall("tag")
-        if _eltags:
-            for item in _eltags:
-                xml_tags.append((item.attrib['k'], item.attrib['v']))
-        xml_tags = retagger.retag(elem.tag, xml_tags)
-
-        # "Implicit" tag "<tagi />"
-        _elimplicittags = elem.findall("tagi")
-        if _elimplicittags:
-            for item in _elimplicittags:
-                xml_tags.append((item.attrib['k'], item.attrib['v']))
-        xml_tags = retagger.retag(elem.tag, xml_tags)
-
-        _elnds = elem.findall("nd")
-        if _elnds:
-            xml_nds = []
-            for item in _elnds:
-                xml_nds.append(int(item.attrib['ref']))
-        _elmembers = elem.findall("member")
-        if _elmembers:
-            xml_members = []
-            for item in _elmembers:
-                # @FIXME this is incomplete
-                _type = item.attrib['type']
-                _ref = int(item.attrib['ref'])
-                _role = item.attrib['role'] if 'role' in item.attrib else None
-                xml_members.append((_type, _ref, _role))
-
-        el = OSMElement(
-            elem.tag,
-            dict(elem.attrib),
-            xml_tags=xml_tags,
-            xml_nds=xml_nds,
-            xml_members=xml_members,
-            xml_filter=xml_filter,
-            tagcaster=tagcaster,
-        )
-        xml_tags = []
-        xml_nds = []
-        xml_members = []
-        if el.can_output():
-            print('\n'.join(el.to_ttl()) + '\n')
-            count += 1
+            yield (elem.tag, dict(elem.attrib), xml_tags, xml_nds, xml_members)
 
         elem.clear()
-        while elem.getprevious() is not None:
-            del elem.getparent()[0]
+        if _HAVE_LXML:
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+
+def _osmrdf_record2ttl(
+        record: tuple, retagger: OSMElementTagger,
+        tagcaster: OSMElementTagValueCast, out: io.StringIO) -> None:
+    """Write one _osmrdf_xmldump_records() record as a Turtle stanza"""
+    tag, attrib, xml_tags, xml_nds, xml_members = record
+
+    xml_tags = retagger.retag(tag, xml_tags)
+
+    el = OSMElement(
+        tag,
+        attrib,
+        xml_tags=xml_tags,
+        xml_nds=xml_nds,
+        xml_members=xml_members,
+        tagcaster=tagcaster,
+    )
+    el.to_ttl(out)
+    out.write('\n')
+
+
+# Records per task sent to each worker; amortizes the pickling round trip
+_DUMP_BATCH_SIZE = 1000
+
+# Per worker process state, set by _osmrdf_dump_worker_init()
+_DUMP_WORKER = {}
+
+
+def _osmrdf_dump_worker_init(retagger: str) -> None:
+    _DUMP_WORKER['retagger'] = OSMElementTagger(retagger)
+    _DUMP_WORKER['tagcaster'] = OSMElementTagValueCast(None)
+
+
+def _osmrdf_dump_worker(batch: List[tuple]) -> bytes:
+    retagger = _DUMP_WORKER['retagger']
+    tagcaster = _DUMP_WORKER['tagcaster']
+    buffer = io.StringIO()
+    for record in batch:
+        _osmrdf_record2ttl(record, retagger, tagcaster, buffer)
+    return buffer.getvalue().encode()
+
+
+def _osmrdf_xmldump_records2ttl_pool(
+        records, retagger: str, workers: int, write) -> None:
+    """Convert records in a process pool, writing results in input order
+
+    The parser stays in this process (lxml objects do not cross process
+    boundaries); at most a few batches per worker are in flight, so memory
+    stays bounded even when the parser is faster than the workers.
+    """
+    pending = collections.deque()
+    with multiprocessing.Pool(
+            workers, _osmrdf_dump_worker_init, (retagger,)) as pool:
+        batch = []
+        for tag, attrib, xml_tags, xml_nds, xml_members in records:
+            # Records are pickled later, after their lists were reused
+            batch.append(
+                (tag, attrib, xml_tags[:], xml_nds[:], xml_members[:]))
+            if len(batch) >= _DUMP_BATCH_SIZE:
+                pending.append(pool.apply_async(_osmrdf_dump_worker, (batch,)))
+                batch = []
+                if len(pending) >= workers * 4:
+                    write(pending.popleft().get())
+        if batch:
+            pending.append(pool.apply_async(_osmrdf_dump_worker, (batch,)))
+        while pending:
+            write(pending.popleft().get())
 
 
 # @TODO after Protobuf, maybe try some alternative which could allow
@@ -661,19 +775,65 @@ def osmrdf_xmldump2_ttl_v2(
 
 OSM_API_DE_FACTO = os.getenv(
     'OSM_API_DE_FACTO', 'https://www.openstreetmap.org/api/0.6')
-CACHE_DRIVER = os.getenv('CACHE_DRIVER', 'sqlite')
+# 'memory' avoids opening SQLite on every cold start; 'sqlite' may share
+# the cache between invocations of the same container
+CACHE_DRIVER = os.getenv('CACHE_DRIVER', 'memory')
 CACHE_TTL = os.getenv('CACHE_TTL', '3600')  # 1 hour
+OSM_API_TIMEOUT = os.getenv('OSM_API_TIMEOUT', '10')  # seconds
+# Upper bound of cached responses (count, not bytes) per container
+CACHE_MAX_ENTRIES = os.getenv('CACHE_MAX_ENTRIES', '256')
+
+
+@functools.lru_cache(maxsize=None)
+def osmapi_session() -> requests_cache.CachedSession:
+    """Cached HTTP session, created once per container on first request
+
+    Warm invocations reuse its keep-alive connection pool, so the TLS
+    handshake with the OSM API is not repeated on every request.
+
+    With cache_control=True the Cache-Control/ETag headers of the OSM API
+    are honored, so stale entries are revalidated (If-None-Match) instead
+    of downloaded again. CACHE_TTL applies when the API sends no headers.
+    """
+    backend_options = {}
+    if CACHE_DRIVER == 'sqlite':
+        # /tmp OpenFaaS allow /tmp be writtable even in read-only mode
+        # However, is not granted that changes will persist or shared
+        backend_options['db_path'] = '/tmp/osmapi_cache.sqlite'
+
+    # @see https://requests-cache.readthedocs.io/en/stable/
+    return requests_cache.CachedSession(
+        'osmapi_cache',
+        backend=CACHE_DRIVER,
+        expire_after=int(CACHE_TTL),
+        allowable_codes=[200, 400, 404, 500],
+        cache_control=True,
+        **backend_options
+    )
+
+
+# URLs this container requested, least recently used first
+_OSMAPI_CACHE_URLS = collections.OrderedDict()
+
+
+def osmapi_cache_prune(
+        session: requests_cache.CachedSession, url: str) -> None:
+    """Evict least recently requested URLs beyond CACHE_MAX_ENTRIES
+
+    The 'memory' backend is a plain unbounded dict, and the OSM API answers
+    with max-age=0, so entries go stale at once but are kept for ETag
+    revalidation; without a cap every distinct /node/N (and relations can
+    be MBs) would stay in a warm container forever. Call before requesting
+    url; only the oldest entries are dropped, so recent ETags survive. The
+    bound counts entries this container added, not bytes.
+    """
+    _OSMAPI_CACHE_URLS[url] = None
+    _OSMAPI_CACHE_URLS.move_to_end(url)
+    max_entries = int(CACHE_MAX_ENTRIES)
+    while len(_OSMAPI_CACHE_URLS) > max_entries:
+        oldest, _ = _OSMAPI_CACHE_URLS.popitem(last=False)
+        session.cache.delete(urls=[oldest])
 
-# @see https://requests-cache.readthedocs.io/en/stable/
-requests_cache.install_cache(
-    'osmapi_cache',
-    # /tmp OpenFaaS allow /tmp be writtable even in read-only mode
-    # However, is not granted that changes will persist or shared
-    db_path= '/tmp/osmapi_cache.sqlite',
-    backend=CACHE_DRIVER,
-    expire_after=CACHE_TTL,
-    allowable_codes=[200, 400, 404, 500]
-)
 
 def handle(event, context):
 
@@ -689,24 +849,34 @@ def handle(event, context):
             }
         }
 
-    content = requests.get(
-        OSM_API_DE_FACTO + event.path)
+    url = OSM_API_DE_FACTO + event.path
+    session = osmapi_session()
+    osmapi_cache_prune(session, url)
+
+    # requests-cache buffers the whole body to store it, so the response is
+    # not streamed. Parse the decoded bytes: on cache hits .raw may still
+    # hold the gzip-encoded body.
+    content = session.get(url, timeout=float(OSM_API_TIMEOUT))
 
-    body_text = content.text
     content_type = content.headers['Content-Type']
 
     if content.status_code == 200:
-        if event.path.startswith('/node'):
-            content_type = 'text/turtle'
-            body_text = osmrdf_node_xml2ttl(body_text)
-
-        elif event.path.startswith('/relation'):
-            content_type = 'text/turtle'
-            body_text = osmrdf_relation_xml2ttl(body_text)
-
-        elif event.path.startswith('/way'):
-            content_type = 'text/turtle'
-            body_text = osmrdf_way_xml2ttl(body_text)
+        body_text = osmrdf_element_xml2ttl(
+            osmrdf_xml_iterparse(io.BytesIO(content.content)))
+
+        if body_text is None:
+            return {
+                "statusCode": 502,
+                "headers": {
+                    'content-type': 'application/json'
+                },
+                "body": {
+                    'error': 'Upstream response has no node, way or relation.'
+                }
+            }
+        content_type = 'text/turtle'
+    else:
+        body_text = content.text
 
     return {
         "statusCode": content.status_code,
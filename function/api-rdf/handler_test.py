@@ -1,4 +1,14 @@
-from .handler import handle
+import collections
+import gzip
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from types import SimpleNamespace
+
+from . import handler
+from .handler import (
+    handle, OSMElement, OSMElementTagger, osmrdf_way_xml2ttl,
+    osmrdf_xmldump2_ttl_v2)
 
 # Test your handler here
 
@@ -8,3 +18,180 @@ from .handler import handle
 def test_handle():
     # assert handle("input") == "input"
     pass
+
+
+def test_to_ttl_escapes_string_literals():
+    el = OSMElement(
+        'node', {'id': '1', 'user': 'a"b'},
+        xml_tags=[('name', 'say "hi"\\\nbye')])
+    out = io.StringIO()
+    el.to_ttl(out)
+    ttl = out.getvalue()
+    assert '    osmm:user "a\\"b" ;\n' in ttl
+    assert '    osmt:name "say \\"hi\\"\\\\\\nbye" ;\n' in ttl
+
+
+class _FakeSession:
+    """Stands in for the requests_cache session; no network access"""
+
+    cache = SimpleNamespace(delete=lambda **kwargs: None)
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def get(self, url, **kwargs):
+        return SimpleNamespace(
+            status_code=200,
+            headers={'Content-Type': 'text/xml; charset=utf-8'},
+            content=self.body)
+
+
+def test_handle_way_to_turtle(monkeypatch):
+    body = b'<osm version="0.6"><way id="2" version="1"><nd ref="1"/>' \
+        b'<tag k="highway" v="x"/></way></osm>'
+    monkeypatch.setattr(handler, 'osmapi_session', lambda: _FakeSession(body))
+    response = handle(SimpleNamespace(path='/way/2'), None)
+    assert response['statusCode'] == 200
+    assert response['headers']['content-type'] == 'text/turtle'
+    assert response['body'].endswith(
+        'osmway:2\n    osmm:type "w" ;\n    osmm:version 1 ;\n'
+        '    osmt:highway "x" ;\n    osmx:hasnodes (osmnode:1) ;\n.\n')
+
+
+def test_handle_upstream_without_element(monkeypatch):
+    monkeypatch.setattr(
+        handler, 'osmapi_session', lambda: _FakeSession(b'<osm/>'))
+    response = handle(SimpleNamespace(path='/node/1'), None)
+    assert response['statusCode'] == 502
+
+
+def test_retag_matches_whole_keys():
+    retagger = OSMElementTagger(
+        "-\t<node>|<way>|<relation>\t*\tcreated_by=*\n"
+        "+\t<way>\t*\tis_in=BRA")
+    assert retagger.retag('way', [('created_by', 'x'), ('created', 'y')]) \
+        == [('created', 'y'), ('is_in', 'BRA')]
+    assert retagger.retag('node', [('is_in', 'PRT')]) == [('is_in', 'PRT')]
+
+
+_DUMP_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+ <bounds minlat="0" minlon="0" maxlat="1" maxlon="1"/>
+ <node id="1" lat="0.5" lon="0.5" version="1">
+  <tag k="created_by" v="x"/><tag k="name" v="a"/>
+ </node>
+ <way id="2" version="3">
+  <nd ref="1"/><nd ref="3"/>
+  <tag k="highway" v="residential"/><tagi k="is_in" v="X"/>
+ </way>
+ <relation id="4" version="1">
+  <member type="way" ref="2" role="outer"/><tag k="type" v="multipolygon"/>
+ </relation>
+ <way id="5" version="1"><nd ref="3"/><tag k="name" v="b"/></way>
+</osm>
+"""
+
+_DUMP_RULES = "+\t<way>\t*\tis_in=BRA\n-\t<node>|<way>|<relation>\t*\tcreated_by=*"
+
+
+def test_xmldump2_ttl_v2_workers_same_output(tmp_path, capsysbinary):
+    dump = tmp_path / 'dump.osm'
+    dump.write_bytes(_DUMP_XML)
+
+    osmrdf_xmldump2_ttl_v2(str(dump), retagger=_DUMP_RULES, workers=1)
+    sequential = capsysbinary.readouterr().out
+    osmrdf_xmldump2_ttl_v2(str(dump), retagger=_DUMP_RULES, workers=2)
+    pooled = capsysbinary.readouterr().out
+
+    assert pooled == sequential
+    # Each element keeps its own children even though the lists are reused
+    assert sequential.count(b'osmt:is_in "BRA" ;') == 2
+    assert b'osmx:hasnodes (osmnode:1 osmnode:3) ;' in sequential
+    assert b'osmx:hasnodes (osmnode:3) ;' in sequential
+    assert b'created_by' not in sequential
+
+
+class _OSMApiStub(BaseHTTPRequestHandler):
+    """Answers like the OSM API: gzip, ETag, max-age=0 and 304s"""
+
+    body = gzip.compress(
+        b'<osm version="0.6"><node id="1" version="1">'
+        b'<tag k="name" v="a"/></node></osm>')
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Cache-Control', 'max-age=0, private')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.send_header('ETag', '"v1"')
+        self.send_header('Cache-Control', 'max-age=0, private')
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve_osmapi_stub(monkeypatch) -> HTTPServer:
+    """Point handler at a local _OSMApiStub with a fresh memory cache"""
+    server = HTTPServer(('127.0.0.1', 0), _OSMApiStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(handler, 'OSM_API_DE_FACTO',
+                        'http://127.0.0.1:%d/api/0.6' % server.server_port)
+    monkeypatch.setattr(handler, 'CACHE_DRIVER', 'memory')
+    monkeypatch.setattr(
+        handler, '_OSMAPI_CACHE_URLS', collections.OrderedDict())
+    handler.osmapi_session.cache_clear()
+    return server
+
+
+def _stop_osmapi_stub(server: HTTPServer) -> None:
+    handler.osmapi_session.cache_clear()
+    server.shutdown()
+    server.server_close()
+
+
+def test_handle_cached_gzip_round_trip(monkeypatch):
+    server = _serve_osmapi_stub(monkeypatch)
+    try:
+        first = handle(SimpleNamespace(path='/node/1'), None)
+        # Revalidated with the ETag, then served from requests-cache
+        second = handle(SimpleNamespace(path='/node/1'), None)
+    finally:
+        _stop_osmapi_stub(server)
+
+    assert first['statusCode'] == second['statusCode'] == 200
+    assert second['body'] == first['body']
+    assert 'osmt:name "a" ;' in second['body']
+
+
+def test_handle_cache_evicts_least_recent(monkeypatch):
+    server = _serve_osmapi_stub(monkeypatch)
+    monkeypatch.setattr(handler, 'CACHE_MAX_ENTRIES', '2')
+    try:
+        for path in ('/node/1', '/node/2', '/node/1', '/node/3'):
+            assert handle(SimpleNamespace(path=path), None)['statusCode'] \
+                == 200
+        cache = handler.osmapi_session().cache
+        api = handler.OSM_API_DE_FACTO
+        assert len(cache.responses) == 2
+        assert cache.contains(url=api + '/node/1')
+        assert cache.contains(url=api + '/node/3')
+        assert not cache.contains(url=api + '/node/2')
+    finally:
+        _stop_osmapi_stub(server)
+
+
+def test_xml2ttl_accepts_xml_string():
+    ttl = osmrdf_way_xml2ttl(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<osm version="0.6"><way id="7"><nd ref="1"/></way></osm>')
+    assert ttl.endswith(
+        'osmway:7\n    osmm:type "w" ;\n'
+        '    osmx:hasnodes (osmnode:1) ;\n.\n')